@@ -4,12 +4,21 @@ Wi-Fi Network Pro Dashboard (Modern Dark Theme + Speedtest Integration + SSID +
 Run:  python wifi_pro_dashboard.py
 Open: http://127.0.0.1:5000
 """
-import os, platform, subprocess, threading, time, csv, re
-from collections import deque
+import os, platform, subprocess, threading, time, csv, re, uuid, hashlib, asyncio, socket, ipaddress, queue
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, render_template_string, jsonify
+from flask import Flask, Response, request
+import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import speedtest
+from waitress import serve
+try:
+    import icmplib
+except ImportError:  # fall back to the system ping binary
+    icmplib = None
 
 # ---------------- CONFIG ----------------
 WIFI_TARGETS = {
@@ -26,39 +35,104 @@ WIFI_TARGETS = {
 }
 
 CHECK_INTERVAL = 8
+PING_TIMEOUT = 2
+RESOLVE_INTERVAL = 900  # seconds between re-resolving hostname targets
+SSID_CACHE_TTL = 120  # seconds; the connected SSID rarely changes
+SPEEDTEST_CACHE_TTL = 60  # seconds a finished result is handed to new clicks
+SPEEDTEST_SERVER_TTL = 600  # seconds before re-running best-server selection
 HISTORY_LENGTH = 300
+STATS_WINDOW = 300  # default /api/stats window, seconds
 LOG_FILE = "wifi_pro_log.csv"
+LOG_FSYNC_INTERVAL = 5  # seconds between fsyncs of the CSV log
+SERVER_THREADS = 16  # waitress worker threads
+MAX_STREAMS = 4  # open /api/stream clients; each holds a worker thread, extra tabs poll instead
+SSE_KEEPALIVE = 15  # seconds between comment frames on an idle event stream
 
 # ----------------------------------------
 app = Flask(__name__)
+# Shared keep-alive pool for future outbound HTTP probes (nothing calls it yet);
+# use session.get/post rather than requests.get so connections are reused.
+session = requests.Session()
+_http_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=Retry(total=1))
+session.mount("http://", _http_adapter)
+session.mount("https://", _http_adapter)
 status_store = {n: {"ip": i, "status": "Unknown", "last": None, "latency": None} for n, i in WIFI_TARGETS.items()}
-history = {n: deque(maxlen=HISTORY_LENGTH) for n in WIFI_TARGETS}
+
+# Per-target ring buffers, struct-of-arrays: epoch ns, up flag, latency (NaN = no reply)
+def _new_history():
+    return {"ts": np.zeros(HISTORY_LENGTH, dtype="i8"),
+            "up": np.zeros(HISTORY_LENGTH, dtype="u1"),
+            "lat": np.full(HISTORY_LENGTH, np.nan, dtype="f4"),
+            "head": 0, "count": 0}
+
+def history_append(h, ts_ns, ok, lat):
+    i = h["head"]
+    h["ts"][i] = ts_ns
+    h["up"][i] = ok
+    h["lat"][i] = np.nan if lat is None else lat
+    h["head"] = (i + 1) % HISTORY_LENGTH
+    h["count"] = min(h["count"] + 1, HISTORY_LENGTH)
+
+def history_snapshot(h):
+    """Return (ts, up, lat) copies in chronological order."""
+    idx = (h["head"] - h["count"] + np.arange(h["count"])) % HISTORY_LENGTH
+    return h["ts"][idx], h["up"][idx], h["lat"][idx]
+
+history = {n: _new_history() for n in WIFI_TARGETS}
 last_status = {n: "Unknown" for n in WIFI_TARGETS}
-lock = threading.Lock()
+history_locks = {n: threading.Lock() for n in WIFI_TARGETS}
+_monitor = None  # (event loop, wake Event) once the monitor thread is running
+speedtest_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speedtest")
+speedtest_jobs = {}  # job_id -> Future, oldest first
+_speedtest_lock = threading.Lock()
+_speedtest_inflight = None      # job_id of the test currently running
+_speedtest_last = (None, 0.0)   # (job_id, finished_at) of the last successful test
+MAX_SPEEDTEST_JOBS = 20
 
-_ping_time_re = re.compile(r'time[=<]\s*([\d\.]+)\s*ms', re.IGNORECASE)
-_windows_avg_re = re.compile(r'Average = (\d+)ms', re.IGNORECASE)
+# Built once: the host is appended per call. -q/-n keep output short and skip reverse DNS.
+if platform.system().lower() == "windows":
+    _PING_ARGV = ("ping", "-n", "1", "-w", str(int(PING_TIMEOUT * 1000)))
+else:
+    _PING_ARGV = ("ping", "-c", "1", "-W", str(int(PING_TIMEOUT)), "-q", "-n")
+# matched on raw ping output bytes: per-reply "time=1.2 ms", the summary "min/avg/max/mdev = 1.1/1.2/...", or Windows "Average = 1ms"
+_ping_rtt_re = re.compile(rb'time[=<]\s*([\d.]+)\s*ms|=\s*[\d.]+/([\d.]+)/|Average = (\d+)ms', re.IGNORECASE)
 
-def ping_latency(host, timeout=2):
-    sys = platform.system().lower()
-    cmd = ["ping", "-n", "1", "-w", str(int(timeout * 1000)), host] if sys == "windows" else ["ping", "-c", "1", "-W", str(int(timeout)), host]
+async def ping_latency(host):
     try:
-        p = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout + 1)
-        out = p.stdout + p.stderr
+        proc = await asyncio.create_subprocess_exec(
+            *_PING_ARGV, host, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
     except Exception:
         return False, None
-    if p.returncode == 0:
-        m = _ping_time_re.search(out) or _windows_avg_re.search(out)
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), PING_TIMEOUT + 1)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return False, None
+    if proc.returncode == 0:
+        m = _ping_rtt_re.search(stdout) or _ping_rtt_re.search(stderr)
         if m:
             try:
-                return True, float(m.group(1))
+                return True, float(m.group(m.lastindex))
             except:
                 pass
         return True, None
     return False, None
 
 # --- NEW: Get current Wi-Fi SSID ---
+_ssid_cache = (None, 0.0)  # (ssid, expires_at on the monotonic clock)
+_ssid_lock = threading.Lock()
+
 def get_current_ssid():
+    global _ssid_cache
+    with _ssid_lock:
+        ssid, expires_at = _ssid_cache
+        if ssid is None or time.monotonic() >= expires_at:
+            ssid = _read_ssid()
+            _ssid_cache = (ssid, time.monotonic() + SSID_CACHE_TTL)
+        return ssid
+
+def _read_ssid():
     sys = platform.system().lower()
     try:
         if sys == "windows":
@@ -78,18 +152,54 @@ def get_current_ssid():
         pass
     return "Unknown"
 
+# Only touched from speedtest_pool's single worker, so no lock is needed.
+_st_obj = None
+_st_best_server_ts = 0.0
+_st_ssid = None  # SSID the cached client's config and best server belong to
+
+def _get_speedtest():
+    global _st_obj, _st_best_server_ts
+    if _st_obj is None:
+        _st_obj = speedtest.Speedtest()  # downloads the config
+        _st_best_server_ts = 0.0
+    if time.monotonic() - _st_best_server_ts > SPEEDTEST_SERVER_TTL:
+        _st_obj.get_best_server()  # fetches the server list and probes the closest ones
+        _st_best_server_ts = time.monotonic()
+    else:
+        _st_obj.get_best_server([_st_obj.best])  # fresh ping to the cached server only
+    return _st_obj
+
 def run_speedtest():
+    global _st_obj
     try:
-        st = speedtest.Speedtest()
-        st.get_best_server()
+        st = _get_speedtest()
         dl = st.download() / 1_000_000
         ul = st.upload() / 1_000_000
         ping = st.results.ping
         return round(dl, 2), round(ul, 2), round(ping, 1)
     except Exception as e:
         print("Speedtest failed:", e)
+        _st_obj = None  # rebuild from a fresh config next time
         return None, None, None
 
+def speedtest_report():
+    global _st_obj, _st_ssid
+    ssid = get_current_ssid()
+    if ssid != _st_ssid:
+        _st_obj = None  # different network, likely a different ISP: rebuild config and server choice
+        _st_ssid = ssid
+    dl, ul, ping = run_speedtest()
+    health, color = compute_health(dl)
+    return {
+        "ssid": ssid,
+        "download_mbps": dl,
+        "upload_mbps": ul,
+        "ping_ms": ping,
+        "health": health,
+        "health_color": color,
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
 def compute_health(download_mbps):
     if download_mbps is None: return "Unknown", "text-gray-400"
     if download_mbps >= 100: return "Excellent", "text-green-400"
@@ -97,17 +207,177 @@ def compute_health(download_mbps):
     if download_mbps >= 10: return "Fair", "text-orange-400"
     return "Weak", "text-red-500"
 
-def monitor_loop():
+# name -> IPv4 address actually pinged, or None while a hostname is unresolved
+# (those targets are reported DOWN without a ping)
+RESOLVED = {}
+
+def resolve_targets(retry_only=False):
+    """Look up hostname targets; with retry_only, just the ones that have never resolved."""
+    for name, host in WIFI_TARGETS.items():
+        if retry_only and RESOLVED.get(name) is not None:
+            continue
+        try:
+            ipaddress.ip_address(host)
+            RESOLVED[name] = host  # already a literal address
+            continue
+        except ValueError:
+            pass
+        try:
+            RESOLVED[name] = socket.getaddrinfo(host, None, socket.AF_INET)[0][4][0]
+        except (OSError, UnicodeError) as e:
+            if not retry_only:
+                print(f"Could not resolve {host}: {e}")
+            RESOLVED[name] = RESOLVED.get(name)  # keep the last good address, if any
+
+async def _staggered_ping(i, host):
+    await asyncio.sleep(i * 0.01)  # stagger launches so a burst of pings isn't dropped
+    return await ping_latency(host)
+
+async def ping_all(hosts):
+    """Ping every host once; returns [(ok, latency_ms), ...] in input order."""
+    global icmplib
+    if not hosts:
+        return []
+    if icmplib is not None:
+        try:
+            res = await icmplib.async_multiping(hosts, count=1, timeout=PING_TIMEOUT,
+                                                concurrent_tasks=len(hosts), privileged=False)
+            return [(h.is_alive, round(h.avg_rtt, 1) if h.is_alive else None) for h in res]
+        except icmplib.SocketPermissionError:
+            # unprivileged ICMP sockets disabled (e.g. net.ipv4.ping_group_range)
+            print("icmplib: no ICMP socket permission, using system ping")
+            icmplib = None
+        except icmplib.ICMPLibError as e:
+            print("icmplib sweep failed, using system ping:", e)
+    # fan out all pings at once: a sweep takes as long as the slowest host
+    return await asyncio.gather(*(_staggered_ping(i, h) for i, h in enumerate(hosts)))
+
+def history_stats(ts, up, lat, since_ns):
+    """Summarise a history_snapshot() down to the samples taken at or after since_ns."""
+    keep = ts >= since_ns
+    up, lat = up[keep], lat[keep]
+    lat = lat[~np.isnan(lat)]
+    stats = {"samples": int(up.size),
+             "uptime_pct": round(float(up.mean()) * 100, 1) if up.size else None,
+             "avg_ms": None, "p95_ms": None, "min_ms": None, "max_ms": None}
+    if lat.size:
+        stats.update(avg_ms=round(float(lat.mean()), 1),
+                     p95_ms=round(float(np.percentile(lat, 95)), 1),
+                     min_ms=round(float(lat.min()), 1),
+                     max_ms=round(float(lat.max()), 1))
+    return stats
+
+def _encode_status(store):
+    body = orjson.dumps(store)
+    return body, hashlib.blake2b(body, digest_size=8).hexdigest()
+
+# status_store and its encoded body are rebuilt each sweep and swapped in whole;
+# readers load the module attribute once and never need a lock.
+_status_json_cache = _encode_status(status_store)  # (body, etag)
+status_changed = threading.Condition()  # notified after each swap, for /api/stream
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+async def sweep():
+    """Ping every target once and publish the results."""
+    global status_store, _status_json_cache
+    targets = [(name, addr) for name, addr in RESOLVED.items() if addr is not None]
+    replies = dict(zip((name for name, _ in targets), await ping_all([addr for _, addr in targets])))
+    results = ((name, ip, replies.get(name, (False, None))) for name, ip in WIFI_TARGETS.items())
+    ts_ns = time.time_ns()
+    ts = datetime.fromtimestamp(ts_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+    new_store, rows = {}, []
+    for name, ip, (ok, lat) in results:
+        status = "UP" if ok else "DOWN"
+        new_store[name] = {"ip": ip, "status": status, "last": ts, "latency": lat}
+        rows.append((name, ts_ns, ok, lat))
+        with history_locks[name]:
+            history_append(history[name], ts_ns, ok, lat)
+        last_status[name] = status
+    log_queue.put(rows)
+    encoded = _encode_status(new_store)
+    with status_changed:
+        status_store, _status_json_cache = new_store, encoded
+        status_changed.notify_all()
+
+async def monitor_async():
+    global _monitor
+    wake = asyncio.Event()  # set to start the next sweep immediately
+    _monitor = (asyncio.get_running_loop(), wake)
+    next_deadline = next_resolve = time.monotonic()
+    while True:
+        # one bad sweep must not end monitoring; log it and try again next interval
+        try:
+            if time.monotonic() >= next_resolve:
+                next_resolve = time.monotonic() + RESOLVE_INTERVAL
+                await asyncio.to_thread(resolve_targets)
+            elif None in RESOLVED.values():
+                await asyncio.to_thread(resolve_targets, True)
+            await sweep()
+        except Exception as e:
+            print("Monitor sweep failed:", repr(e))
+        # sweeps start every CHECK_INTERVAL regardless of how long each one takes
+        next_deadline = max(next_deadline + CHECK_INTERVAL, time.monotonic())
+        try:
+            await asyncio.wait_for(wake.wait(), next_deadline - time.monotonic())
+            wake.clear()
+            next_deadline = time.monotonic()
+        except asyncio.TimeoutError:
+            pass
+
+# ---------------- CSV LOG ----------------
+log_queue = queue.SimpleQueue()  # one list of (name, ts_ns, ok, latency) per sweep
+
+def _open_log():
+    new_file = not os.path.exists(LOG_FILE) or os.path.getsize(LOG_FILE) == 0
+    f = open(LOG_FILE, "a", newline="", buffering=1 << 16)
+    if new_file:
+        csv.writer(f).writerow(["Time", "Name", "IP", "Status", "Latency_ms"])
+    return f
+
+def log_writer():
+    """Append queued sweeps to LOG_FILE: one write per batch, fsync at most every LOG_FSYNC_INTERVAL.
+
+    While the file can't be opened or written (locked by another program, disk
+    full) batches are dropped and the open is retried on the next one, so the
+    queue never backs up.
+    """
+    f, failing = None, False
+    last_sync = time.monotonic()
     while True:
-        for name, ip in WIFI_TARGETS.items():
-            ok, lat = ping_latency(ip)
-            status = "UP" if ok else "DOWN"
-            ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            with lock:
-                status_store[name].update({"ip": ip, "status": status, "last": ts, "latency": lat})
-                history[name].append((ts, 1 if ok else 0, lat))
-            last_status[name] = status
-        time.sleep(CHECK_INTERVAL)
+        batch = log_queue.get()
+        try:
+            while True:
+                batch += log_queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            if f is None:
+                f = _open_log()
+            csv.writer(f).writerows(
+                (datetime.fromtimestamp(ts_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S"), name,
+                 WIFI_TARGETS[name], "UP" if ok else "DOWN", "" if lat is None else lat)
+                for name, ts_ns, ok, lat in batch)
+            f.flush()
+            if time.monotonic() - last_sync >= LOG_FSYNC_INTERVAL:
+                os.fsync(f.fileno())
+                last_sync = time.monotonic()
+            if failing:
+                print("CSV log writable again:", LOG_FILE)
+                failing = False
+        except OSError as e:
+            if not failing:
+                print(f"CSV log write failed, dropping rows until it recovers: {e}")
+                failing = True
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+                f = None
+
+def monitor_loop():
+    # one event loop drives every probe; no thread per ping
+    asyncio.run(monitor_async())
 
 # ---------------- FLASK ----------------
 HTML = """<!doctype html><html lang="en"><head>
@@ -179,8 +449,17 @@ $(document).ready(function() {
     ],
     paging: false, searching: false, info: false, dom: 'rt'
   });
-  updateAll();
-  setInterval(updateAll, interval * 1000);
+  const startPolling = () => {
+    updateAll();
+    setInterval(updateAll, interval * 1000);
+  };
+  if (window.EventSource) {
+    const es = new EventSource("/api/stream");
+    es.onmessage = e => renderTable(JSON.parse(e.data));
+    es.onerror = () => { es.close(); startPolling(); };  // stream cap reached or server gone
+  } else {
+    startPolling();
+  }
 });
 
 // --- SPEEDTEST + Wi-Fi ---
@@ -192,8 +471,12 @@ document.getElementById("runSpeedtest").addEventListener("click", async () => {
   resDiv.innerHTML = "<p class='text-yellow-400'>Testing speed...</p>";
 
   try {
-    const res = await fetch("/api/speedtest");
-    const j = await res.json();
+    const { job_id } = await fetch("/api/speedtest", { method: "POST" }).then(r => r.json());
+    let j;
+    do {
+      await new Promise(r => setTimeout(r, 1500));
+      j = await fetch(`/api/speedtest/${job_id}`).then(r => r.json());
+    } while (j.status === "running");
 
     if (j.download_mbps) {
       const dlColor = j.download_mbps >= 100 ? "text-green-400"
@@ -231,31 +514,111 @@ document.getElementById("runSpeedtest").addEventListener("click", async () => {
 </script>
 </body></html>"""
 
+def _json_body(body):
+    return Response(body, mimetype="application/json")
+
+def _json(obj):
+    return _json_body(orjson.dumps(obj))
+
+# the page only depends on config, so render it once at import
+_INDEX_HTML = app.jinja_env.from_string(HTML).render(interval=CHECK_INTERVAL, total=len(WIFI_TARGETS))
+
 @app.route("/")
 def index():
-    return render_template_string(HTML, interval=CHECK_INTERVAL, total=len(WIFI_TARGETS))
+    return Response(_INDEX_HTML, mimetype="text/html")
 
 @app.route("/api/status")
 def api_status():
-    with lock:
-        return jsonify(status_store)
+    body, etag = _status_json_cache
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = _json_body(body)
+    resp.set_etag(etag)
+    return resp
+
+def _status_events():
+    body, etag = _status_json_cache
+    yield b"data: " + body + b"\n\n"
+    while True:
+        with status_changed:
+            status_changed.wait_for(lambda: _status_json_cache[1] != etag, timeout=SSE_KEEPALIVE)
+            body, new_etag = _status_json_cache
+        if new_etag == etag:
+            yield b": keepalive\n\n"  # also detects clients that went away
+            continue
+        etag = new_etag
+        yield b"data: " + body + b"\n\n"
 
-@app.route("/api/speedtest")
+@app.route("/api/stream")
+def api_stream():
+    # one push per sweep to every open tab instead of each tab polling /api/status
+    if not _stream_slots.acquire(blocking=False):
+        return _json({"status": "busy"}), 503
+    resp = Response(_status_events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
+    resp.call_on_close(_stream_slots.release)
+    return resp
+
+@app.route("/api/stats")
+def api_stats():
+    window = request.args.get("window", STATS_WINDOW, type=int)
+    window = min(max(window, 1), HISTORY_LENGTH * CHECK_INTERVAL)  # span the ring buffers hold
+    since_ns = time.time_ns() - window * 1_000_000_000
+    stats = {}
+    for name in WIFI_TARGETS:
+        with history_locks[name]:
+            snapshot = history_snapshot(history[name])
+        stats[name] = history_stats(*snapshot, since_ns)
+    return _json({"window": window, "targets": stats})
+
+@app.route("/api/refresh", methods=["POST"])
+def api_refresh():
+    if _monitor is not None:
+        loop, wake = _monitor
+        loop.call_soon_threadsafe(wake.set)
+    return _json({"status": "ok"}), 202
+
+def _speedtest_finished(job_id, fut):
+    global _speedtest_inflight, _speedtest_last
+    with _speedtest_lock:
+        _speedtest_inflight = None
+        if not fut.cancelled() and fut.exception() is None and fut.result()["download_mbps"] is not None:
+            _speedtest_last = (job_id, time.monotonic())
+
+@app.route("/api/speedtest", methods=["POST"])
 def api_speedtest():
-    ssid = get_current_ssid()
-    dl, ul, ping = run_speedtest()
-    health, color = compute_health(dl)
-    return jsonify({
-        "ssid": ssid,
-        "download_mbps": dl,
-        "upload_mbps": ul,
-        "ping_ms": ping,
-        "health": health,
-        "health_color": color,
-        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    })
+    # the test takes 15-40s; run it off the request thread and let the page poll.
+    # Clicks during a run join it, and a fresh result is reused for a minute,
+    # so concurrent clients never start competing transfers.
+    global _speedtest_inflight
+    with _speedtest_lock:
+        last_id, finished_at = _speedtest_last
+        if last_id in speedtest_jobs and time.monotonic() - finished_at < SPEEDTEST_CACHE_TTL:
+            return _json({"job_id": last_id}), 202
+        if _speedtest_inflight is not None:
+            return _json({"job_id": _speedtest_inflight}), 202
+        job_id = uuid.uuid4().hex
+        fut = speedtest_pool.submit(speedtest_report)
+        speedtest_jobs[job_id] = fut
+        _speedtest_inflight = job_id
+        while len(speedtest_jobs) > MAX_SPEEDTEST_JOBS:
+            speedtest_jobs.pop(next(iter(speedtest_jobs)))
+    fut.add_done_callback(lambda f: _speedtest_finished(job_id, f))
+    return _json({"job_id": job_id}), 202
+
+@app.route("/api/speedtest/<job_id>")
+def api_speedtest_result(job_id):
+    with _speedtest_lock:
+        fut = speedtest_jobs.get(job_id)
+    if fut is None:
+        return _json({"status": "unknown"}), 404
+    if not fut.done():
+        return _json({"status": "running"})
+    return _json({"status": "done", **fut.result()})
 
 if __name__ == "__main__":
+    threading.Thread(target=log_writer, daemon=True).start()
     threading.Thread(target=monitor_loop, daemon=True).start()
     print("Wi-Fi Pro Dashboard running at http://127.0.0.1:5000")
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    serve(app, host="0.0.0.0", port=5000, threads=SERVER_THREADS)